@@ -1,33 +1,112 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import argparse
 import base64
+import hashlib
 import math
+import os
+import struct
 import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterable
+from typing import Callable, Iterable, Sequence, TextIO, TypeVar
+
+T = TypeVar("T")
 
 ROOT = Path(__file__).resolve().parent.parent
 PROTO_DIR = ROOT / "lib" / "test" / "proto"
 OUT_DIR = ROOT / "lib" / "test"
+STAMP_FILE = Path(__file__).with_name(".gen_codec_tests.stamp")
+BYTE_ESCAPES = [f"\\x{b:02x}" for b in range(256)]
+FIXED32 = struct.Struct("<I")
+FIXED64 = struct.Struct("<Q")
+MOON_STRING_ESCAPES = str.maketrans(
+    {"\\": "\\\\", '"': '\\"', "\n": "\\n", "\r": "\\r", "\t": "\\t"}
+)
+SIMPLE_ENUM_VALUES = {
+    "SIMPLE_ENUM_ZERO": 0,
+    "SIMPLE_ENUM_ONE": 1,
+    "SIMPLE_ENUM_TWO": 2,
+    "SIMPLE_ENUM_MAX": 2147483647,
+}
+STATUS_CODES = {"STATUS_UNSPECIFIED": 0, "STATUS_OK": 1, "STATUS_FAIL": 2}
+
+
+def run_protoc_batch(
+    proto_name: str, batches: Sequence[tuple[str, Sequence[str]]]
+) -> list[list[bytes]]:
+    # Encode every distinct textproto with a single protoc process by wrapping
+    # each (message, textprotos) batch as a repeated field of a throwaway
+    # message, then split the encoded items back out per field.
+    unique = [list(dict.fromkeys(textprotos)) for _, textprotos in batches]
+    with tempfile.TemporaryDirectory() as batch_dir:
+        batch_proto = Path(batch_dir) / "codec_batch.proto"
+        fields = "".join(
+            f"  repeated .{message} items_{number} = {number};\n"
+            for number, (message, _) in enumerate(batches, start=1)
+        )
+        batch_proto.write_text(
+            f'syntax = "proto3";\nimport "{proto_name}";\n'
+            f"message Batch {{\n{fields}}}\n",
+            encoding="utf-8",
+        )
+        batch_text = "".join(
+            f"items_{number} {{\n{textproto}}}\n"
+            for number, textprotos in enumerate(unique, start=1)
+            for textproto in textprotos
+        )
+        cmd = [
+            "protoc",
+            f"--proto_path={PROTO_DIR}",
+            f"--proto_path={batch_dir}",
+            "--encode=Batch",
+            str(batch_proto),
+        ]
+        result = subprocess.run(
+            cmd,
+            input=batch_text.encode("utf-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+    encoded = split_batch(result.stdout, len(batches))
+    output = []
+    for (message, textprotos), distinct, items in zip(batches, unique, encoded):
+        if len(items) != len(distinct):
+            raise ValueError(
+                f"expected {len(distinct)} encoded {message} items, got {len(items)}"
+            )
+        by_text = dict(zip(distinct, items))
+        output.append([by_text[textproto] for textproto in textprotos])
+    return output
 
 
-def run_protoc(proto_name: str, message: str, textproto: str) -> bytes:
-    proto_path = PROTO_DIR / proto_name
-    cmd = [
-        "protoc",
-        f"--proto_path={PROTO_DIR}",
-        f"--encode={message}",
-        str(proto_path),
-    ]
-    result = subprocess.run(
-        cmd,
-        input=textproto.encode("utf-8"),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        check=True,
-    )
-    return result.stdout
+def read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def split_batch(data: bytes, count: int) -> list[list[bytes]]:
+    batches: list[list[bytes]] = [[] for _ in range(count)]
+    pos = 0
+    while pos < len(data):
+        tag, pos = read_varint(data, pos)
+        number, wire_type = tag >> 3, tag & 0x7
+        if wire_type != 2 or not 1 <= number <= count:
+            raise ValueError(f"unexpected batch tag {tag:#x}")
+        size, pos = read_varint(data, pos)
+        batches[number - 1].append(data[pos : pos + size])
+        pos += size
+    return batches
 
 
 def b64(data: bytes) -> str:
@@ -41,28 +120,29 @@ def textproto_string_literal(value: str) -> str:
 
 
 def textproto_bytes_literal(value: bytes) -> str:
-    escaped = "".join(f"\\x{b:02x}" for b in value)
+    escaped = "".join([BYTE_ESCAPES[b] for b in value])
     return f'"{escaped}"'
 
 
+def textproto_bool(value: bool) -> str:
+    return "true" if value else "false"
+
+
 def moon_string_literal(value: str) -> str:
-    escaped = (
-        value.replace("\\", "\\\\")
-        .replace('"', "\\\"")
-        .replace("\n", "\\n")
-        .replace("\r", "\\r")
-        .replace("\t", "\\t")
-    )
-    return f'"{escaped}"'
+    return f'"{value.translate(MOON_STRING_ESCAPES)}"'
 
 
 def moon_bytes_literal(value: bytes) -> str:
     if not value:
         return 'b""'
-    escaped = "".join(f"\\x{b:02x}" for b in value)
+    escaped = "".join([BYTE_ESCAPES[b] for b in value])
     return f'b"{escaped}"'
 
 
+def moon_bool(value: bool) -> str:
+    return "true" if value else "false"
+
+
 def moon_int(value: int) -> str:
     return str(value)
 
@@ -79,16 +159,20 @@ def moon_uint64(value: int) -> str:
     return f"{value}UL"
 
 
-def moon_array(items: Iterable[str]) -> str:
-    items = list(items)
-    if not items:
-        return "[]"
+def write_lines(out: TextIO, lines: Iterable[str]) -> None:
+    for line in lines:
+        out.write(line)
+        out.write("\n")
+
+
+def moon_array(items: list[str]) -> str:
     return "[" + ", ".join(items) + "]"
 
 def normalize_exponent(text: str) -> str:
-    if "e" not in text and "E" not in text:
+    index = text.find("e")
+    if index < 0:
         return text
-    head, exp = text.replace("E", "e").split("e", 1)
+    head, exp = text[:index], text[index + 1 :]
     sign = ""
     if exp.startswith(("+", "-")):
         sign = exp[0]
@@ -111,13 +195,17 @@ def float_literal(value: float) -> str:
 def float_bits_from_encoded(data: bytes) -> int:
     if len(data) < 5:
         raise ValueError("float encoding too short")
-    return int.from_bytes(data[1:5], "little")
+    return FIXED32.unpack_from(data, 1)[0]
 
 
 def double_bits_from_encoded(data: bytes) -> int:
     if len(data) < 9:
         raise ValueError("double encoding too short")
-    return int.from_bytes(data[1:9], "little")
+    return FIXED64.unpack_from(data, 1)[0]
+
+
+def strided(values: list[T], step: int, count: int) -> list[T]:
+    return [values[(i * step) % len(values)] for i in range(count)]
 
 
 def simple_cases():
@@ -397,7 +485,6 @@ def simple_cases():
     simple_specs = [
         {
             "name": "int32",
-            "proto": "simple.proto",
             "message": "codec.simple.Int32Value",
             "wire_type": 0,
             "read": "@protobuf.read_int32()",
@@ -405,11 +492,10 @@ def simple_cases():
             "values": int32_values,
             "moon_type": "Int",
             "format": moon_int,
-            "textproto": lambda v: f"value: {v}",
+            "textproto": "value: {}".format,
         },
         {
             "name": "int64",
-            "proto": "simple.proto",
             "message": "codec.simple.Int64Value",
             "wire_type": 0,
             "read": "@protobuf.read_int64()",
@@ -417,11 +503,10 @@ def simple_cases():
             "values": int64_values,
             "moon_type": "Int64",
             "format": moon_int64,
-            "textproto": lambda v: f"value: {v}",
+            "textproto": "value: {}".format,
         },
         {
             "name": "uint32",
-            "proto": "simple.proto",
             "message": "codec.simple.UInt32Value",
             "wire_type": 0,
             "read": "@protobuf.read_uint32()",
@@ -429,11 +514,10 @@ def simple_cases():
             "values": uint32_values,
             "moon_type": "UInt",
             "format": moon_uint,
-            "textproto": lambda v: f"value: {v}",
+            "textproto": "value: {}".format,
         },
         {
             "name": "uint64",
-            "proto": "simple.proto",
             "message": "codec.simple.UInt64Value",
             "wire_type": 0,
             "read": "@protobuf.read_uint64()",
@@ -441,11 +525,10 @@ def simple_cases():
             "values": uint64_values,
             "moon_type": "UInt64",
             "format": moon_uint64,
-            "textproto": lambda v: f"value: {v}",
+            "textproto": "value: {}".format,
         },
         {
             "name": "sint32",
-            "proto": "simple.proto",
             "message": "codec.simple.SInt32Value",
             "wire_type": 0,
             "read": "@protobuf.read_sint32()",
@@ -453,12 +536,11 @@ def simple_cases():
             "values": sint32_values,
             "moon_type": "Int",
             "format": moon_int,
-            "textproto": lambda v: f"value: {v}",
+            "textproto": "value: {}".format,
             "unwrap": ".0",
         },
         {
             "name": "sint64",
-            "proto": "simple.proto",
             "message": "codec.simple.SInt64Value",
             "wire_type": 0,
             "read": "@protobuf.read_sint64()",
@@ -466,45 +548,35 @@ def simple_cases():
             "values": sint64_values,
             "moon_type": "Int64",
             "format": moon_int64,
-            "textproto": lambda v: f"value: {v}",
+            "textproto": "value: {}".format,
             "unwrap": ".0",
         },
         {
             "name": "bool",
-            "proto": "simple.proto",
             "message": "codec.simple.BoolValue",
             "wire_type": 0,
             "read": "@protobuf.read_bool()",
             "write": "@protobuf.write_bool",
             "values": bool_values,
             "moon_type": "Bool",
-            "format": lambda v: "true" if v else "false",
-            "textproto": lambda v: f"value: {'true' if v else 'false'}",
+            "format": moon_bool,
+            "textproto": lambda v: f"value: {textproto_bool(v)}",
         },
         {
             "name": "enum",
-            "proto": "simple.proto",
             "message": "codec.simple.EnumValue",
             "wire_type": 0,
             "read": "@protobuf.read_enum()",
             "write": "@protobuf.write_enum",
             "values": enum_values,
             "moon_type": "UInt",
-            "format": lambda v: moon_uint(
-                {
-                    "SIMPLE_ENUM_ZERO": 0,
-                    "SIMPLE_ENUM_ONE": 1,
-                    "SIMPLE_ENUM_TWO": 2,
-                    "SIMPLE_ENUM_MAX": 2147483647,
-                }[v]
-            ),
-            "textproto": lambda v: f"value: {v}",
+            "format": lambda v: moon_uint(SIMPLE_ENUM_VALUES[v]),
+            "textproto": "value: {}".format,
             "unwrap": ".0",
             "wrap": "@protobuf.Enum",
         },
         {
             "name": "fixed32",
-            "proto": "simple.proto",
             "message": "codec.simple.Fixed32Value",
             "wire_type": 5,
             "read": "@protobuf.read_fixed32()",
@@ -512,11 +584,10 @@ def simple_cases():
             "values": fixed32_values,
             "moon_type": "UInt",
             "format": moon_uint,
-            "textproto": lambda v: f"value: {v}",
+            "textproto": "value: {}".format,
         },
         {
             "name": "fixed64",
-            "proto": "simple.proto",
             "message": "codec.simple.Fixed64Value",
             "wire_type": 1,
             "read": "@protobuf.read_fixed64()",
@@ -524,11 +595,10 @@ def simple_cases():
             "values": fixed64_values,
             "moon_type": "UInt64",
             "format": moon_uint64,
-            "textproto": lambda v: f"value: {v}",
+            "textproto": "value: {}".format,
         },
         {
             "name": "sfixed32",
-            "proto": "simple.proto",
             "message": "codec.simple.SFixed32Value",
             "wire_type": 5,
             "read": "@protobuf.read_sfixed32()",
@@ -536,11 +606,10 @@ def simple_cases():
             "values": sfixed32_values,
             "moon_type": "Int",
             "format": moon_int,
-            "textproto": lambda v: f"value: {v}",
+            "textproto": "value: {}".format,
         },
         {
             "name": "sfixed64",
-            "proto": "simple.proto",
             "message": "codec.simple.SFixed64Value",
             "wire_type": 1,
             "read": "@protobuf.read_sfixed64()",
@@ -548,11 +617,10 @@ def simple_cases():
             "values": sfixed64_values,
             "moon_type": "Int64",
             "format": moon_int64,
-            "textproto": lambda v: f"value: {v}",
+            "textproto": "value: {}".format,
         },
         {
             "name": "float",
-            "proto": "simple.proto",
             "message": "codec.simple.FloatValue",
             "wire_type": 5,
             "read": "@protobuf.read_float()",
@@ -560,12 +628,11 @@ def simple_cases():
             "values": float_values,
             "moon_type": "UInt",
             "format": moon_uint,
-            "textproto": lambda v: f"value: {v}",
+            "textproto": "value: {}".format,
             "float_bits": True,
         },
         {
             "name": "double",
-            "proto": "simple.proto",
             "message": "codec.simple.DoubleValue",
             "wire_type": 1,
             "read": "@protobuf.read_double()",
@@ -573,12 +640,11 @@ def simple_cases():
             "values": double_values,
             "moon_type": "UInt64",
             "format": moon_uint64,
-            "textproto": lambda v: f"value: {v}",
+            "textproto": "value: {}".format,
             "double_bits": True,
         },
         {
             "name": "bytes",
-            "proto": "simple.proto",
             "message": "codec.simple.BytesValue",
             "wire_type": 2,
             "read": "@protobuf.read_bytes()",
@@ -590,7 +656,6 @@ def simple_cases():
         },
         {
             "name": "string",
-            "proto": "simple.proto",
             "message": "codec.simple.StringValue",
             "wire_type": 2,
             "read": "@protobuf.read_string()",
@@ -602,14 +667,18 @@ def simple_cases():
         },
     ]
 
-    for spec in simple_specs:
+    batches = [
+        (spec["message"], [spec["textproto"](value) + "\n" for value in spec["values"]])
+        for spec in simple_specs
+    ]
+    for spec, encodings in zip(simple_specs, run_protoc_batch("simple.proto", batches)):
+        float_bits = spec.get("float_bits", False)
+        double_bits = spec.get("double_bits", False)
         entries = []
-        for value in spec["values"]:
-            textproto = spec["textproto"](value)
-            encoded = run_protoc(spec["proto"], spec["message"], textproto + "\n")
-            if spec.get("float_bits"):
+        for value, encoded in zip(spec["values"], encodings):
+            if float_bits:
                 expected = float_bits_from_encoded(encoded)
-            elif spec.get("double_bits"):
+            elif double_bits:
                 expected = double_bits_from_encoded(encoded)
             else:
                 expected = value
@@ -618,23 +687,30 @@ def simple_cases():
     return cases
 
 
-def render_simple_test(cases) -> str:
-    lines = [
-        "// Code generated by scripts/gen_codec_tests.py. DO NOT EDIT.",
-        "",
-    ]
+def render_simple_test(cases, out: TextIO) -> None:
+    out.write("// Code generated by scripts/gen_codec_tests.py. DO NOT EDIT.\n")
     for item in cases:
+        lines = [""]
         spec = item["spec"]
         name = spec["name"]
         wire_type = spec["wire_type"]
         moon_type = spec["moon_type"]
         unwrap = spec.get("unwrap", "")
         wrap = spec.get("wrap", "")
+        float_bits = spec.get("float_bits", False)
+        double_bits = spec.get("double_bits", False)
+        fn_suffix = "_bits" if float_bits or double_bits else ""
         read_expr = f"reader |> {spec['read']}"
         if unwrap:
             read_expr = f"({read_expr}){unwrap}"
 
-        if spec.get("float_bits"):
+        if float_bits:
+            to_bits = "value.reinterpret_as_uint()"
+            from_bits = "Float::reinterpret_from_int(bits.reinterpret_as_int())"
+        elif double_bits:
+            to_bits = "value.reinterpret_as_uint64()"
+            from_bits = "Int64::reinterpret_as_double(bits.reinterpret_as_int64())"
+        if fn_suffix:
             lines.extend(
                 [
                     f"fn decode_{name}_bits(b64 : String) -> {moon_type} raise {{",
@@ -644,46 +720,14 @@ def render_simple_test(cases) -> str:
                     "  @debug.assert_eq(tag, 1U)",
                     f"  @debug.assert_eq(wire_type, {wire_type}U)",
                     f"  let value = {read_expr}",
-                    "  value.reinterpret_as_uint()",
+                    f"  {to_bits}",
                     "}",
                     "",
                     f"fn encode_{name}_bits(bits : {moon_type}) -> String raise {{",
                     "  let writer = Buffer()",
                     f"  writer |> @protobuf.write_tag((1U, {wire_type}U))",
-                    "  let value = Float::reinterpret_from_int(bits.reinterpret_as_int())",
+                    f"  let value = {from_bits}",
                     f"  writer |> {spec['write']}(value)",
-                    "  writer.to_bytes() |> @protobuf.base64_encode",
-                    "}",
-                    "",
-                    "///|",
-                    f"test \"simple/{name}\" {{",
-                    f"  let cases : Array[(String, {moon_type})] = [",
-                ]
-            )
-        elif spec.get("double_bits"):
-            lines.extend(
-                [
-                    f"fn decode_{name}_bits(b64 : String) -> {moon_type} raise {{",
-                    "  let bytes = @protobuf.base64_decode(b64)",
-                    "  let reader = @protobuf.BytesReader::from_bytes(bytes) as &@protobuf.Reader",
-                    "  let (tag, wire_type) = reader |> @protobuf.read_tag()",
-                    "  @debug.assert_eq(tag, 1U)",
-                    f"  @debug.assert_eq(wire_type, {wire_type}U)",
-                    f"  let value = {read_expr}",
-                    "  value.reinterpret_as_uint64()",
-                    "}",
-                    "",
-                    f"fn encode_{name}_bits(bits : {moon_type}) -> String raise {{",
-                    "  let writer = Buffer()",
-                    f"  writer |> @protobuf.write_tag((1U, {wire_type}U))",
-                    "  let value = Int64::reinterpret_as_double(bits.reinterpret_as_int64())",
-                    f"  writer |> {spec['write']}(value)",
-                    "  writer.to_bytes() |> @protobuf.base64_encode",
-                    "}",
-                    "",
-                    "///|",
-                    f"test \"simple/{name}\" {{",
-                    f"  let cases : Array[(String, {moon_type})] = [",
                 ]
             )
         else:
@@ -707,57 +751,33 @@ def render_simple_test(cases) -> str:
                 lines.append(f"  writer |> {spec['write']}({wrap}(value))")
             else:
                 lines.append(f"  writer |> {spec['write']}(value)")
-            lines.extend(
-                [
-                    "  writer.to_bytes() |> @protobuf.base64_encode",
-                    "}",
-                    "",
-                    "///|",
-                    f"test \"simple/{name}\" {{",
-                    f"  let cases : Array[(String, {moon_type})] = [",
-                ]
-            )
+        lines.extend(
+            [
+                "  writer.to_bytes() |> @protobuf.base64_encode",
+                "}",
+                "",
+                "///|",
+                f"test \"simple/{name}\" {{",
+                f"  let cases : Array[(String, {moon_type})] = [",
+            ]
+        )
 
+        format_value = spec["format"]
         for b64_value, expected in item["entries"]:
-            if spec.get("float_bits") or spec.get("double_bits"):
-                expected_literal = spec["format"](expected)
-            else:
-                expected_literal = spec["format"](expected)
-            lines.append(f"    (\"{b64_value}\", {expected_literal}),")
+            lines.append(f"    (\"{b64_value}\", {format_value(expected)}),")
 
         lines.extend(
             [
                 "  ]",
                 "  for case in cases {",
                 "    let (b64, expected) = case",
+                f"    @debug.assert_eq(decode_{name}{fn_suffix}(b64), expected)",
+                f"    @debug.assert_eq(encode_{name}{fn_suffix}(expected), b64)",
+                "  }",
+                "}",
             ]
         )
-
-        if spec.get("float_bits"):
-            lines.extend(
-                [
-                    f"    @debug.assert_eq(decode_{name}_bits(b64), expected)",
-                    f"    @debug.assert_eq(encode_{name}_bits(expected), b64)",
-                ]
-            )
-        elif spec.get("double_bits"):
-            lines.extend(
-                [
-                    f"    @debug.assert_eq(decode_{name}_bits(b64), expected)",
-                    f"    @debug.assert_eq(encode_{name}_bits(expected), b64)",
-                ]
-            )
-        else:
-            lines.extend(
-                [
-                    f"    @debug.assert_eq(decode_{name}(b64), expected)",
-                    f"    @debug.assert_eq(encode_{name}(expected), b64)",
-                ]
-            )
-
-        lines.extend(["  }", "}", ""])
-
-    return "\n".join(lines)
+        write_lines(out, lines)
 
 
 def middle_cases():
@@ -908,51 +928,51 @@ def middle_cases():
         },
     ]
     total = 80
-    for i in range(total):
-        cases.append(
-            {
-                "id": ids[i % len(ids)],
-                "values": values_cases[(i * 3) % len(values_cases)],
-                "packed_values": packed_cases[(i * 5) % len(packed_cases)],
-                "label": labels[(i * 7) % len(labels)],
-                "data": data_cases[(i * 11) % len(data_cases)],
-                "nested": nested_cases[(i * 13) % len(nested_cases)],
-                "status": statuses[(i * 17) % len(statuses)],
-                "tags": tags_cases[(i * 19) % len(tags_cases)],
-            }
-        )
-
-    output = []
+    columns = {
+        "id": strided(ids, 1, total),
+        "values": strided(values_cases, 3, total),
+        "packed_values": strided(packed_cases, 5, total),
+        "label": strided(labels, 7, total),
+        "data": strided(data_cases, 11, total),
+        "nested": strided(nested_cases, 13, total),
+        "status": strided(statuses, 17, total),
+        "tags": strided(tags_cases, 19, total),
+    }
+    cases.extend(dict(zip(columns, row)) for row in zip(*columns.values()))
+
+    textprotos = []
     for case in cases:
         lines = []
         lines.append(f"id: {case['id']}")
-        for value in case["values"]:
-            lines.append(f"values: {value}")
-        for value in case["packed_values"]:
-            lines.append(f"packed_values: {value}")
+        lines.extend(map("values: {}".format, case["values"]))
+        lines.extend(map("packed_values: {}".format, case["packed_values"]))
         if case["label"]:
             lines.append(f"label: {textproto_string_literal(case['label'])}")
         if case["data"]:
             lines.append(f"data: {textproto_bytes_literal(case['data'])}")
         if case["nested"] is not None:
             nested = case["nested"]
-            lines.append("nested {")
-            lines.append(f"  count: {nested['count']}")
-            lines.append(f"  flag: {'true' if nested['flag'] else 'false'}")
-            lines.append(f"  note: {textproto_string_literal(nested['note'])}")
-            lines.append("}")
+            lines.append(
+                f"nested {{\n"
+                f"  count: {nested['count']}\n"
+                f"  flag: {textproto_bool(nested['flag'])}\n"
+                f"  note: {textproto_string_literal(nested['note'])}\n"
+                f"}}"
+            )
         if case["status"] is not None:
             lines.append(f"status: {case['status']}")
-        for tag in case["tags"]:
-            lines.append(f"tags: {textproto_string_literal(tag)}")
-        textproto = "\n".join(lines) + "\n"
-        encoded = run_protoc("middle.proto", "codec.middle.Middle", textproto)
-        output.append((b64(encoded), case))
-    return output
+        lines.extend(
+            "tags: " + textproto_string_literal(tag) for tag in case["tags"]
+        )
+        textprotos.append("\n".join(lines) + "\n")
+    [encodings] = run_protoc_batch(
+        "middle.proto", [("codec.middle.Middle", textprotos)]
+    )
+    return [(b64(encoded), case) for encoded, case in zip(encodings, cases)]
 
 
-def render_middle_test(cases) -> str:
-    lines = [
+def render_middle_test(cases, out: TextIO) -> None:
+    header = [
         "// Code generated by scripts/gen_codec_tests.py. DO NOT EDIT.",
         "",
         "struct MiddleDecoded {",
@@ -1103,8 +1123,10 @@ def render_middle_test(cases) -> str:
         "test \"middle/messages\" {",
         "  let cases : Array[MiddleCase] = [",
     ]
+    write_lines(out, header)
 
     for b64_value, case in cases:
+        lines = []
         nested = "None"
         if case["nested"] is not None:
             nested_value = case["nested"]
@@ -1113,7 +1135,7 @@ def render_middle_test(cases) -> str:
                 + ", ".join(
                     [
                         moon_int64(nested_value["count"]),
-                        "true" if nested_value["flag"] else "false",
+                        moon_bool(nested_value["flag"]),
                         moon_string_literal(nested_value["note"]),
                     ]
                 )
@@ -1123,28 +1145,26 @@ def render_middle_test(cases) -> str:
         lines.append(f"      b64: \"{b64_value}\",")
         lines.append(f"      id: {moon_int(case['id'])},")
         lines.append(
-            f"      values: {moon_array(moon_int(v) for v in case['values'])},"
+            f"      values: {moon_array([moon_int(v) for v in case['values']])},"
         )
         lines.append(
-            f"      packed_values: {moon_array(moon_int(v) for v in case['packed_values'])},"
+            f"      packed_values: {moon_array([moon_int(v) for v in case['packed_values']])},"
         )
         lines.append(f"      label: {moon_string_literal(case['label'])},")
         lines.append(f"      data: {moon_bytes_literal(case['data'])},")
         lines.append(f"      nested: {nested},")
         status_value = 0
         if case["status"] is not None:
-            status_value = {
-                "STATUS_UNSPECIFIED": 0,
-                "STATUS_OK": 1,
-                "STATUS_FAIL": 2,
-            }[case["status"]]
+            status_value = STATUS_CODES[case["status"]]
         lines.append(f"      status: {moon_uint(status_value)},")
         lines.append(
-            f"      tags: {moon_array(moon_string_literal(tag) for tag in case['tags'])},"
+            f"      tags: {moon_array([moon_string_literal(tag) for tag in case['tags']])},"
         )
         lines.append("    },")
+        write_lines(out, lines)
 
-    lines.extend(
+    write_lines(
+        out,
         [
             "  ]",
             "  for case in cases {",
@@ -1160,12 +1180,9 @@ def render_middle_test(cases) -> str:
             "    @debug.assert_eq(encode_middle(case), case.b64)",
             "  }",
             "}",
-            "",
-        ]
+        ],
     )
 
-    return "\n".join(lines)
-
 
 def difficult_cases():
     big_values = [
@@ -1344,30 +1361,27 @@ def difficult_cases():
         },
     ]
     total = 70
-    for i in range(total):
-        choice_text, choice_number = choices[(i * 17) % len(choices)]
-        cases.append(
-            {
-                "big": big_values[i % len(big_values)],
-                "zigzag": zigzag_values[(i * 3) % len(zigzag_values)],
-                "ratio": ratio_values[(i * 5) % len(ratio_values)],
-                "scores": scores_cases[(i * 7) % len(scores_cases)],
-                "items": items_cases[(i * 11) % len(items_cases)],
-                "counts": counts_cases[(i * 13) % len(counts_cases)],
-                "choice_text": choice_text,
-                "choice_number": choice_number,
-                "payload": payload_cases[(i * 19) % len(payload_cases)],
-            }
-        )
-
-    output = []
+    choice_column = strided(choices, 17, total)
+    columns = {
+        "big": strided(big_values, 1, total),
+        "zigzag": strided(zigzag_values, 3, total),
+        "ratio": strided(ratio_values, 5, total),
+        "scores": strided(scores_cases, 7, total),
+        "items": strided(items_cases, 11, total),
+        "counts": strided(counts_cases, 13, total),
+        "choice_text": [text for text, _ in choice_column],
+        "choice_number": [number for _, number in choice_column],
+        "payload": strided(payload_cases, 19, total),
+    }
+    cases.extend(dict(zip(columns, row)) for row in zip(*columns.values()))
+
+    textprotos = []
     for case in cases:
         lines = []
         lines.append(f"big: {case['big']}")
         lines.append(f"zigzag: {case['zigzag']}")
         lines.append(f"ratio: {float_literal(case['ratio'])}")
-        for score in case["scores"]:
-            lines.append(f"scores: {float_literal(score)}")
+        lines.extend("scores: " + float_literal(score) for score in case["scores"])
         for item in case["items"]:
             lines.append("items {")
             lines.append(f"  name: {textproto_string_literal(item['name'])}")
@@ -1387,14 +1401,15 @@ def difficult_cases():
         if case["payload"]:
             lines.append(f"payload: {textproto_bytes_literal(case['payload'])}")
 
-        textproto = "\n".join(lines) + "\n"
-        encoded = run_protoc("difficult.proto", "codec.difficult.Difficult", textproto)
-        output.append((b64(encoded), case))
-    return output
+        textprotos.append("\n".join(lines) + "\n")
+    [encodings] = run_protoc_batch(
+        "difficult.proto", [("codec.difficult.Difficult", textprotos)]
+    )
+    return [(b64(encoded), case) for encoded, case in zip(encodings, cases)]
 
 
-def render_difficult_test(cases) -> str:
-    lines = [
+def render_difficult_test(cases, out: TextIO) -> None:
+    header = [
         "// Code generated by scripts/gen_codec_tests.py. DO NOT EDIT.",
         "",
         "struct DifficultDecoded {",
@@ -1584,8 +1599,10 @@ def render_difficult_test(cases) -> str:
         "test \"difficult/messages\" {",
         "  let cases : Array[DifficultCase] = [",
     ]
+    write_lines(out, header)
 
     for b64_value, case in cases:
+        lines = []
         choice_text = "None"
         if case["choice_text"] is not None:
             choice_text = f"Some({moon_string_literal(case['choice_text'])})"
@@ -1598,7 +1615,7 @@ def render_difficult_test(cases) -> str:
         lines.append(f"      zigzag: {moon_int(case['zigzag'])},")
         lines.append(f"      ratio: {float_literal(case['ratio'])},")
         lines.append(
-            f"      scores: {moon_array(float_literal(score) for score in case['scores'])},"
+            f"      scores: {moon_array([float_literal(score) for score in case['scores']])},"
         )
         item_literals = []
         for item in case["items"]:
@@ -1624,8 +1641,10 @@ def render_difficult_test(cases) -> str:
         lines.append(f"      choice_number: {choice_number},")
         lines.append(f"      payload: {moon_bytes_literal(case['payload'])},")
         lines.append("    },")
+        write_lines(out, lines)
 
-    lines.extend(
+    write_lines(
+        out,
         [
             "  ]",
             "  for case in cases {",
@@ -1642,12 +1661,9 @@ def render_difficult_test(cases) -> str:
             "    @debug.assert_eq(encode_difficult(case), case.b64)",
             "  }",
             "}",
-            "",
-        ]
+        ],
     )
 
-    return "\n".join(lines)
-
 
 def bad_cases():
     cases = [
@@ -1683,12 +1699,10 @@ def bad_cases():
     return output
 
 
-def render_bad_test(cases) -> str:
-    lines = [
-        "// Code generated by scripts/gen_codec_tests.py. DO NOT EDIT.",
-        "",
-    ]
+def render_bad_test(cases, out: TextIO) -> None:
+    out.write("// Code generated by scripts/gen_codec_tests.py. DO NOT EDIT.\n")
     for case in cases:
+        lines = [""]
         lines.extend(
             [
                 "///|",
@@ -1728,28 +1742,118 @@ def render_bad_test(cases) -> str:
                     "  )",
                 ]
             )
-        lines.extend(["}", ""])
-    return "\n".join(lines)
+        lines.append("}")
+        write_lines(out, lines)
+
+
+SUITES = {
+    "codec_simple_test.mbt": ("simple.proto", simple_cases, render_simple_test),
+    "codec_middle_test.mbt": ("middle.proto", middle_cases, render_middle_test),
+    "codec_difficult_test.mbt": (
+        "difficult.proto",
+        difficult_cases,
+        render_difficult_test,
+    ),
+    "codec_bad_test.mbt": (None, bad_cases, render_bad_test),
+}
+
+
+def generate_suite(
+    name: str, cases: Callable[[], list], render: Callable[[list, TextIO], None]
+) -> None:
+    suite_cases = cases()
+    # Render next to the target and swap it in, so a failure never truncates it.
+    target = OUT_DIR / name
+    staging = target.with_name(f".{name}.tmp")
+    try:
+        with open(staging, "w", encoding="utf-8") as out:
+            render(suite_cases, out)
+        os.replace(staging, target)
+    except BaseException:
+        staging.unlink(missing_ok=True)
+        raise
+
+
+def suite_digests() -> dict[str, str]:
+    base = hashlib.blake2b()
+    base.update(Path(__file__).read_bytes())
+    version = subprocess.run(
+        ["protoc", "--version"], check=True, capture_output=True
+    ).stdout
+    base.update(version)
+    digests = {}
+    for name, (proto_name, _, _) in SUITES.items():
+        digest = base.copy()
+        if proto_name is not None:
+            digest.update((PROTO_DIR / proto_name).read_bytes())
+        digests[name] = digest.hexdigest()
+    return digests
+
+
+def output_digest(name: str) -> str | None:
+    try:
+        return hashlib.blake2b((OUT_DIR / name).read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def read_stamps() -> dict[str, tuple[str, str]]:
+    try:
+        text = STAMP_FILE.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return {}
+    stamps = {}
+    for line in text.splitlines():
+        fields = line.split(" ")
+        if len(fields) == 3:
+            stamps[fields[0]] = (fields[1], fields[2])
+    return stamps
+
+
+def write_stamps(stamps: dict[str, tuple[str, str]]) -> None:
+    lines = [
+        f"{name} {inputs} {output}\n"
+        for name, (inputs, output) in sorted(stamps.items())
+    ]
+    STAMP_FILE.write_text("".join(lines), encoding="utf-8")
 
 
 def main() -> None:
-    OUT_DIR.mkdir(parents=True, exist_ok=True)
-
-    simple = simple_cases()
-    simple_text = render_simple_test(simple)
-    (OUT_DIR / "codec_simple_test.mbt").write_text(simple_text, encoding="utf-8")
-
-    middle = middle_cases()
-    middle_text = render_middle_test(middle)
-    (OUT_DIR / "codec_middle_test.mbt").write_text(middle_text, encoding="utf-8")
+    parser = argparse.ArgumentParser(description="Generate the codec tests")
+    parser.add_argument(
+        "--force", action="store_true", help="regenerate even if inputs are unchanged"
+    )
+    args = parser.parse_args()
+
+    digests = suite_digests()
+    stamps = {} if args.force else read_stamps()
+    stale = [
+        name
+        for name, digest in digests.items()
+        if stamps.get(name) != (digest, output_digest(name))
+    ]
+    if not stale:
+        print("Codec tests are up to date")
+        return
 
-    difficult = difficult_cases()
-    difficult_text = render_difficult_test(difficult)
-    (OUT_DIR / "codec_difficult_test.mbt").write_text(difficult_text, encoding="utf-8")
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    bad = bad_cases()
-    bad_text = render_bad_test(bad)
-    (OUT_DIR / "codec_bad_test.mbt").write_text(bad_text, encoding="utf-8")
+    with ThreadPoolExecutor() as executor:
+        futures = [
+            executor.submit(generate_suite, name, *SUITES[name][1:]) for name in stale
+        ]
+    errors = []
+    for name, future in zip(stale, futures):
+        try:
+            future.result()
+        except Exception as error:
+            error.add_note(f"while generating {name}")
+            errors.append(error)
+        else:
+            stamps[name] = (digests[name], output_digest(name))
+    write_stamps(stamps)
+    if errors:
+        raise ExceptionGroup("failed to generate codec suites", errors)
 
 
 if __name__ == "__main__":
@@ -2,14 +2,19 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import logging
 import os
+import shlex
 import shutil
 import subprocess
 import sys
+import tempfile
+import threading
 import tomllib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Mapping, Sequence
+from typing import IO, Callable, Iterable, Iterator, Mapping, Sequence, TypeVar
 
 
 ROOT = Path(__file__).resolve().parents[1]
@@ -18,6 +23,7 @@ LIB_DIR = ROOT / "lib"
 PLUGIN_DIR = ROOT / "plugin"
 COMPILER_TEST_DIR = ROOT / "test" / "compiler"
 READER_DIR = ROOT / "test" / "reader"
+GO_GEN_DIR = ROOT / "test" / "go-gen" / "cli"
 SNAPSHOT_DIR = ROOT / "test" / "snapshots"
 HARNESS_DIR = ROOT / "test" / "harness"
 HARNESS_CASES_DIR = HARNESS_DIR / "cases"
@@ -32,6 +38,7 @@ PLUGIN_EXE = (
     / "protoc-gen-mbt"
     / "protoc-gen-mbt.exe"
 )
+PROTOC_PLUGIN_ARG = f"--plugin=protoc-gen-mbt={PLUGIN_EXE}"
 STANDARD_PROTO_FILES = [
     "plugin.proto",
     "google/protobuf/any.proto",
@@ -49,6 +56,9 @@ STANDARD_PROTO_FILES = [
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+R = TypeVar("R")
+
 
 def configure_logging() -> None:
     logging.basicConfig(
@@ -65,32 +75,87 @@ def run(
     env: Mapping[str, str] | None = None,
     description: str | None = None,
     check: bool = True,
+    label: str | None = None,
+    forward_stdout: bool = True,
 ) -> subprocess.CompletedProcess[str]:
     if description:
         logger.info("%s...", description)
-    logger.info("$ %s", " ".join(command))
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("$ %s", shlex.join(command))
 
-    result = subprocess.run(
-        command,
+    process = subprocess.Popen(
+        [find_tool(command[0]), *command[1:]],
         cwd=cwd,
         env=env,
-        text=True,
-        capture_output=True,
-        check=False,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
     )
-    if check and result.returncode != 0:
-        print_output(result)
+    stdout: list[str] = []
+    stderr: list[str] = []
+    forwarders = [
+        threading.Thread(
+            target=forward_output,
+            args=(
+                process.stdout,
+                stdout,
+                logging.INFO if forward_stdout else None,
+                label,
+            ),
+            daemon=True,
+        ),
+        threading.Thread(
+            target=forward_output,
+            args=(process.stderr, stderr, logging.WARNING, label),
+            daemon=True,
+        ),
+    ]
+    for forwarder in forwarders:
+        forwarder.start()
+    for forwarder in forwarders:
+        forwarder.join()
+    returncode = process.wait()
+
+    result = subprocess.CompletedProcess(
+        command,
+        returncode,
+        stdout="".join(stdout),
+        stderr="".join(stderr),
+    )
+    if check and returncode != 0:
         raise subprocess.CalledProcessError(
-            result.returncode,
+            returncode,
             command,
             output=result.stdout,
             stderr=result.stderr,
         )
-    if result.returncode == 0 and result.stdout:
-        logger.info(result.stdout.rstrip())
     return result
 
 
+@functools.cache
+def find_tool(name: str) -> str:
+    path = shutil.which(name)
+    if path is None:
+        raise RuntimeError(f"required tool not found on PATH: {name}")
+    return path
+
+
+def forward_output(
+    stream: IO[bytes], lines: list[str], level: int | None, label: str | None = None
+) -> None:
+    # Decode each line as UTF-8 ourselves: moon and protoc emit UTF-8 regardless
+    # of the locale encoding a text-mode pipe would assume (e.g. cp1252 on Windows).
+    with stream:
+        for raw_line in stream:
+            line = raw_line.decode("utf-8", "replace")
+            lines.append(line)
+            if level is None:
+                continue
+            if label:
+                logger.log(level, "[%s] %s", label, line.rstrip("\r\n"))
+            else:
+                logger.log(level, line.rstrip("\r\n"))
+
+
 def moon(
     args: Sequence[str],
     *,
@@ -98,23 +163,60 @@ def moon(
     env: Mapping[str, str] | None = None,
     description: str | None = None,
     check: bool = True,
+    label: str | None = None,
 ) -> subprocess.CompletedProcess[str]:
-    return run(["moon", *args], cwd=cwd, env=env, description=description, check=check)
+    return run(
+        ["moon", *args],
+        cwd=cwd,
+        env=env,
+        description=description,
+        check=check,
+        label=label,
+    )
+
+
+def run_concurrently(function: Callable[[T], R], items: Iterable[T]) -> list[R]:
+    pending = list(items)
+    if not pending:
+        return []
+    workers = min(len(pending), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(function, item) for item in pending]
+    return [future.result() for future in futures]
 
 
-def print_output(result: subprocess.CompletedProcess[str]) -> None:
-    for name, text in (("STDOUT", result.stdout), ("STDERR", result.stderr)):
-        if text:
-            print(f"=== {name} ===")
-            print(text)
-            print("==============")
+def walk_sources(root: Path) -> Iterator[tuple[Path, list[str]]]:
+    # Generated output (__snapshot, _build) and hidden directories never hold
+    # inputs, so skip them instead of walking every generated file.
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [name for name in dirnames if not name.startswith(("_", "."))]
+        yield Path(dirpath), filenames
 
 
 def moon_work_env(work_file: Path) -> dict[str, str]:
     return {**os.environ, "MOON_WORK": str(work_file.resolve())}
 
 
+def plugin_is_up_to_date() -> bool:
+    try:
+        built_at = PLUGIN_EXE.stat().st_mtime_ns
+    except FileNotFoundError:
+        return False
+    sources = [ROOT / "moon.work"]
+    for source_dir in (CLI_DIR, LIB_DIR):
+        for directory, filenames in walk_sources(source_dir):
+            sources.extend(
+                directory / name
+                for name in filenames
+                if name.endswith(".mbt") or name in ("moon.mod", "moon.pkg")
+            )
+    return all(path.stat().st_mtime_ns < built_at for path in sources)
+
+
 def build_plugin() -> None:
+    if os.environ.get("FORCE_REBUILD") != "1" and plugin_is_up_to_date():
+        logger.info("Plugin is up to date at %s", PLUGIN_EXE)
+        return
     moon(
         ["build", "--target", "native", "--deny-warn"],
         cwd=CLI_DIR,
@@ -149,7 +251,7 @@ def run_protoc(
     run(
         [
             "protoc",
-            f"--plugin=protoc-gen-mbt={PLUGIN_EXE}",
+            PROTOC_PLUGIN_ARG,
             *proto_paths,
             f"--mbt_out={output_dir}",
             f"--mbt_opt={','.join(mbt_options)}",
@@ -159,7 +261,7 @@ def run_protoc(
     )
 
 
-def generate_plugin(_: argparse.Namespace) -> None:
+def generate_plugin(args: argparse.Namespace) -> None:
     if not (PLUGIN_DIR / "plugin.proto").exists():
         raise RuntimeError(f"plugin.proto not found: {PLUGIN_DIR / 'plugin.proto'}")
 
@@ -183,13 +285,19 @@ def generate_plugin(_: argparse.Namespace) -> None:
             "generate_runtime_wkt=true",
         ],
     )
-    for args, description in (
-        (["check", "--target", "native", "--deny-warn"], "Running moon check (native)"),
+    # moon test already type-checks the packages it builds with --deny-warn.
+    if args.strict:
+        moon(
+            ["check", "--target", "native", "--deny-warn"],
+            cwd=LIB_DIR,
+            description="Running moon check (native)",
+        )
+    for moon_args, description in (
         (["test", "--target", "native", "--deny-warn"], "Running moon test (native)"),
         (["fmt"], "Running moon fmt"),
         (["info", "--target", "native"], "Running moon info (native)"),
     ):
-        moon(args, cwd=LIB_DIR, description=description)
+        moon(moon_args, cwd=LIB_DIR, description=description)
     moon(
         ["test", "--target", "native", "--deny-warn"],
         cwd=COMPILER_TEST_DIR,
@@ -202,12 +310,16 @@ def snapshot_test(args: argparse.Namespace) -> None:
     logger.info("Project root: %s", ROOT)
     build_plugin()
 
-    proto_dirs = sorted({path.parent for path in SNAPSHOT_DIR.rglob("*.proto")})
+    snapshot_protos = {
+        directory: sorted(name for name in filenames if name.endswith(".proto"))
+        for directory, filenames in walk_sources(SNAPSHOT_DIR)
+    }
+    proto_dirs = sorted(path for path, names in snapshot_protos.items() if names)
     if not proto_dirs:
         raise RuntimeError(f"no .proto files found in {SNAPSHOT_DIR}")
 
-    for proto_dir in proto_dirs:
-        proto_files = sorted(path.name for path in proto_dir.glob("*.proto"))
+    def generate_snapshot(proto_dir: Path) -> None:
+        proto_files = snapshot_protos[proto_dir]
         shutil.rmtree(proto_dir / "__snapshot", ignore_errors=True)
         run_protoc(
             proto_dir=proto_dir,
@@ -217,97 +329,118 @@ def snapshot_test(args: argparse.Namespace) -> None:
             include_path=args.include_path,
             options=["generate_runtime_wkt=true"],
         )
+
+    def check_snapshot(proto_dir: Path) -> bool:
         snapshot_src = proto_dir / "__snapshot" / "src"
-        if snapshot_src.exists():
-            result = moon(
-                ["check", "src", "--target", "native", "--deny-warn"],
-                cwd=proto_dir / "__snapshot",
-                env=moon_work_env(proto_dir / "moon.work"),
-                description=f"Checking generated snapshot for {proto_dir}",
-                check=False,
-            )
-            if result.returncode != 0:
-                print_output(result)
-                raise subprocess.CalledProcessError(
-                    result.returncode,
-                    result.args,
-                    output=result.stdout,
-                    stderr=result.stderr,
-                )
-        else:
+        if not snapshot_src.exists():
             logger.info("No source packages generated for %s", proto_dir)
+            return True
+        result = moon(
+            ["check", "src", "--target", "native", "--deny-warn"],
+            cwd=proto_dir / "__snapshot",
+            env=moon_work_env(proto_dir / "moon.work"),
+            description=f"Checking generated snapshot for {proto_dir}",
+            check=False,
+            label=proto_dir.relative_to(SNAPSHOT_DIR).as_posix(),
+        )
+        return result.returncode == 0
+
+    run_concurrently(generate_snapshot, proto_dirs)
+    results = run_concurrently(check_snapshot, proto_dirs)
+    failures = [
+        proto_dir.relative_to(SNAPSHOT_DIR).as_posix()
+        for proto_dir, passed in zip(proto_dirs, results)
+        if not passed
+    ]
+    if failures:
+        raise RuntimeError("snapshot check failed: " + ", ".join(failures))
 
     logger.info("Code generation completed")
     if args.update:
         logger.info("Snapshot test completed with snapshots updated.")
         return
 
-    diff = run(
-        ["git", "diff", "--name-only", "test/snapshots"],
+    status = run(
+        ["git", "status", "--porcelain", "-z", "--", "test/snapshots"],
         cwd=ROOT,
+        env={**os.environ, "GIT_OPTIONAL_LOCKS": "0"},
         description="Checking snapshot diff",
         check=False,
+        forward_stdout=False,
     )
-    if diff.returncode != 0:
-        print_output(diff)
-        raise RuntimeError("failed to run git diff")
-
-    changed = diff.stdout.splitlines()
+    if status.returncode != 0:
+        raise RuntimeError("failed to run git status")
+
+    # Only worktree changes and untracked files count; staged-only changes pass.
+    changed = []
+    entries = iter(status.stdout.split("\0"))
+    for entry in entries:
+        if not entry:
+            continue
+        code, path = entry[:2], entry[3:]
+        if "R" in code or "C" in code:
+            next(entries, None)
+        if code == "??" or code[1] != " ":
+            changed.append(path)
     if changed:
-        logger.warning("Changes detected in snapshots via git diff:")
+        logger.warning("Changes detected in snapshots via git status:")
         for path in changed:
             logger.info("  - %s", path)
         raise RuntimeError("snapshot test failed - differences detected")
     logger.info("All snapshots match")
 
 
+def build_go_fixtures(bin_dir: Path) -> None:
+    logger.info("Building Go binary...")
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory() as build_dir:
+        go_gen = Path(build_dir) / ("go-gen.exe" if os.name == "nt" else "go-gen")
+        run(
+            ["go", "build", "-o", str(go_gen), "main.go", "p2_cases.go", "p3_cases.go"],
+            cwd=GO_GEN_DIR,
+        )
+        logger.info("Go binary built successfully")
+        for extra_args in ([], ["-f", "json"]):
+            run([str(go_gen), *extra_args, "-o", str(bin_dir)], cwd=GO_GEN_DIR)
+
+
 def reader_test(args: argparse.Namespace) -> None:
     reader_env = moon_work_env(READER_DIR / "moon.work")
     runner_dir = READER_DIR / "runner"
-    bin_dir = READER_DIR / "bin"
-    go_gen_cli_dir = ROOT / "test" / "go-gen" / "cli"
 
     logger.info("Project root: %s", ROOT)
-    build_plugin()
-
-    logger.info("Generating MoonBit code from proto files...")
-    proto_files = sorted(READER_DIR.glob("*.proto"))
-    if not proto_files:
-        raise RuntimeError(f"no .proto files found in {READER_DIR}")
-    for proto_file in proto_files:
-        project_name = f"gen_{proto_file.stem}"
-        run_protoc(
-            proto_dir=READER_DIR,
-            output_dir=READER_DIR,
-            project_name=project_name,
-            proto_files=[proto_file.name],
-            include_path=args.include_path,
-        )
-        moon(
-            ["fmt", "src"],
-            cwd=READER_DIR / project_name,
-            env=reader_env,
-            description=f"Formatting generated {project_name}",
-        )
-    logger.info("MoonBit code generated successfully")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        go_fixtures = executor.submit(build_go_fixtures, READER_DIR / "bin")
+        build_plugin()
+
+        logger.info("Generating MoonBit code from proto files...")
+        proto_files = sorted(READER_DIR.glob("*.proto"))
+        if not proto_files:
+            raise RuntimeError(f"no .proto files found in {READER_DIR}")
+
+        def generate_reader_code(proto_file: Path) -> None:
+            project_name = f"gen_{proto_file.stem}"
+            run_protoc(
+                proto_dir=READER_DIR,
+                output_dir=READER_DIR,
+                project_name=project_name,
+                proto_files=[proto_file.name],
+                include_path=args.include_path,
+            )
 
-    logger.info("Building Go binary...")
-    bin_dir.mkdir(parents=True, exist_ok=True)
-    for extra_args in ([], ["-f", "json"]):
-        run(
-            [
-                "go",
-                "run",
-                "main.go",
-                "p2_cases.go",
-                "p3_cases.go",
-                *extra_args,
-                "-o",
-                str(bin_dir),
-            ],
-            cwd=go_gen_cli_dir,
-        )
-    logger.info("Go binary built successfully")
+        run_concurrently(generate_reader_code, proto_files)
+        # The projects share the reader workspace and its _build lock, so format
+        # them one at a time.
+        for proto_file in proto_files:
+            project_name = f"gen_{proto_file.stem}"
+            moon(
+                ["fmt", "src"],
+                cwd=READER_DIR / project_name,
+                env=reader_env,
+                description=f"Formatting generated {project_name}",
+            )
+        logger.info("MoonBit code generated successfully")
+        go_fixtures.result()
 
     logger.info("Running reader test...")
     test_args = ["test", "src", "--target", "all", "--deny-warn"]
@@ -321,7 +454,6 @@ def reader_test(args: argparse.Namespace) -> None:
         )
         if result.returncode != 0:
             logger.warning("Initial reader test failed before update")
-            print_output(result)
             moon(
                 ["test", "src", "--target", "native", "--update", "--deny-warn"],
                 cwd=runner_dir,
@@ -375,10 +507,7 @@ def run_generated_code_case(case_dir: Path) -> bool:
         description=f"Running {case_dir.name} generated-code tests",
         check=False,
     )
-    if result.returncode != 0:
-        print_output(result)
-        return False
-    return True
+    return result.returncode == 0
 
 
 def generated_code_test(_: argparse.Namespace) -> None:
@@ -399,8 +528,7 @@ def generated_code_test(_: argparse.Namespace) -> None:
             f"no generated-code harness cases found in {HARNESS_CASES_DIR}",
         )
 
-    for case_dir in case_dirs:
-        generate_harness_case(case_dir)
+    run_concurrently(generate_harness_case, case_dirs)
 
     for case_dir in case_dirs:
         if not run_generated_code_case(case_dir):
@@ -427,6 +555,11 @@ def parse_args(argv: Sequence[str]) -> argparse.Namespace:
         aliases=["generate_plugin"],
         help="regenerate plugin code from plugin.proto",
     )
+    generate.add_argument(
+        "--strict",
+        action="store_true",
+        help="run moon check before moon test",
+    )
     generate.set_defaults(handler=generate_plugin)
 
     reader = subcommands.add_parser(